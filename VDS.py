@@ -28,7 +28,15 @@ timeout = 20
 """
 
 from labrad.server import LabradServer, setting, Signal
-from twisted.internet.defer import inlineCallbacks, returnValue
+from labrad.decorators import Setting
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList, DeferredQueue, maybeDeferred
+from twisted.internet.task import deferLater
+from collections import deque
+import cProfile
+import math
+import os
+import time
 import labrad.units as units
 from labrad.types import Value
 
@@ -63,6 +71,8 @@ class ChannelInstance(object):
 		set_max,
 		set_offset,
 		set_scale,
+		set_group_setting,
+		set_group_slot,
 
 		):
 
@@ -90,12 +100,71 @@ class ChannelInstance(object):
 			self.set_max		   = set_max
 			self.set_offset		= set_offset
 			self.set_scale		 = set_scale
+			self.set_group_setting = set_group_setting
+			self.set_group_slot	= set_group_slot
 
 	#def __repr__(self):
 	#	return """Channel Instance Object with < ID:{ID} name:{name} >\n\n{description}""".format(ID=self.ID,name=self.name,description=self.description)
 	#def __str__(self):
 	#	return """Channel Instance Object with < ID:{ID} name:{name} >\n\n{description}""".format(ID=self.ID,name=self.name,description=self.description)
 
+###############################
+## RegistryContextPool class ##
+###############################
+class RegistryContextPool(object):
+	"""
+	Fixed-size pool of registry contexts.
+	The registry's working directory is per-context, so every registry operation leases its own
+	context for its duration instead of sharing one. A leased context may be in any directory;
+	the lessee must cd to an absolute path before using it.
+	"""
+	def __init__(self,client,size):
+		self.contexts = DeferredQueue()
+		for n in range(size):
+			self.contexts.put(client.context())
+
+	def lease(self):
+		"""Returns a Deferred that fires with a free context once one is available"""
+		return self.contexts.get()
+
+	def release(self,context):
+		"""Returns a leased context to the pool"""
+		self.contexts.put(context)
+
+#############################
+## ReactorLagMonitor class ##
+#############################
+class ReactorLagMonitor(object):
+	"""
+	Measures reactor lag: how late the reactor runs a call scheduled every <interval> seconds.
+	A blocked reactor shows up as large delays. Keeps the most recent <n_samples> delays (seconds).
+	"""
+	def __init__(self,interval,n_samples):
+		self.interval = interval
+		self.samples  = deque(maxlen=n_samples)
+		self.call     = None
+
+	def start(self):
+		if self.call is None:self.schedule()
+
+	def stop(self):
+		if (self.call is not None) and self.call.active():self.call.cancel()
+		self.call = None
+
+	def schedule(self):
+		self.expected = reactor.seconds() + self.interval
+		self.call     = reactor.callLater(self.interval,self.tick)
+
+	def tick(self):
+		self.samples.append(max(0.0,reactor.seconds()-self.expected))
+		self.schedule()
+
+	def percentiles(self,percents):
+		"""Returns the (nearest-rank) percentiles of the stored delays, in seconds. All zero if there are no samples yet."""
+		samples = sorted(self.samples)
+		if not samples:return [0.0 for p in percents]
+		return [samples[min(len(samples)-1,max(0,int(math.ceil(p/100.0*len(samples)))-1))] for p in percents]
+
 ###############################
 ## Formatting/data functions ##
 ###############################
@@ -106,6 +175,19 @@ def to_type(value,type_):
 	if type_ in ['integer','int','i'] : return int(value)
 	return Value(value,type_)
 
+def gather(deferreds):
+	"""Like gatherResults, but waits for every deferred to finish before failing, and fails with the first error itself rather than a FirstError wrapping it"""
+	def collect(results):
+		for success,result in results:
+			if not success:return result # the first Failure
+		return [result for success,result in results]
+	return DeferredList(deferreds,consumeErrors=True).addCallback(collect)
+
+def check_group_setting(set_group_setting,set_group_slot):
+	"""Raises a ValueError if set_group_setting isn't empty or [server, device, setting], or if set_group_slot is negative"""
+	if len(set_group_setting) not in [0,3]:raise ValueError("set_group_setting must be empty or of the form [server, device, setting]; was {set_group_setting}".format(set_group_setting=set_group_setting))
+	if set_group_slot < 0:raise ValueError("set_group_slot must be non-negative; was {set_group_slot}".format(set_group_slot=set_group_slot))
+
 def assemble_set_list(set_var_slot,set_var_value,set_statics):
 	if set_var_slot > len(set_statics):raise ValueError("Variable slot ({set_var_slot}) higher than highest input slot ({h_slot})".format(set_var_slot=set_var_slot,h_slot=len(set_statics)))
 	ret = []
@@ -123,6 +205,16 @@ class VirtualDeviceServer(LabradServer):
 	name             = 'virtual_device_server'                 # server name (as appears in pylabrad connections)
 	channel_location = ['','virtual_device_server','channels'] # registry location of channel information
 	none_types       = ['none','None','-','']                         # these strings will be interpreted as <None> by the VDS
+	reg_pool_size    = 8                                               # number of registry contexts that can be in use at once
+
+	info_keys = ["ID","name","label","description","tags","has_get","has_set"]                            # keys required in a channel's folder
+	get_keys  = ["setting","inputs","inputs_units"]                                                         # keys required in its <get> folder
+	set_keys  = ["setting","var_slot","var_units","statics","statics_units","min","max","offset","scale"] # keys required in its <set> folder
+
+	profiling        = False # whether profiling mode (reactor lag monitor & setting timing) is on; toggled by the "profiling mode" setting
+	lag_interval     = 0.1   # seconds between reactor lag measurements
+	lag_samples      = 3000  # number of most recent reactor lag measurements kept
+	profile_location = '.'   # directory that "profile" writes cProfile captures to
 
 	channels_by_id   = {} # These start out empty
 	channels_by_name = {} # And will be populated on server init
@@ -136,67 +228,119 @@ class VirtualDeviceServer(LabradServer):
 	@inlineCallbacks
 	def initServer(self):
 		self.reg         = self.client.registry  # more convenient connection to the registry
-		self.reg_context = self.client.context() # context for registry operations
+		self.reg_pool    = RegistryContextPool(self.client,self.reg_pool_size) # contexts for registry operations
+		self.group_contexts = {} # (server, device, setting) : context; one per group setting, so group calls never change a channel's selected device
 		yield self.registry_setup()              # set up the registry directory if it hasn't been already
+		self.lag_monitor   = ReactorLagMonitor(self.lag_interval,self.lag_samples)
+		self.setting_stats = {} # setting name : [calls, total time, max time] (seconds)
+		self.profiler      = None
+		if self.profiling:self.lag_monitor.start()
 		self.channels_by_id,self.channels_by_name = yield self.load_all_channels()
 
+	def _dispatch(self,func,*args,**kw):
+		"""Every request is run through here by LabradServer. When profiling, records the wall time of each setting call, except the profiling settings (2000-2003) themselves.
+		Relies on pylabrad (>=0.98) calling self._dispatch(setting.handleRequest, ...) for each setting; _dispatch is not a documented LabradServer hook."""
+		handler = getattr(func,'__self__',None)
+		if not (self.profiling and isinstance(handler,Setting) and not (2000 <= handler.ID <= 2003)):
+			return LabradServer._dispatch(self,func,*args,**kw)
+
+		start = time.time()
+		def record(result):
+			elapsed = time.time() - start
+			times   = self.setting_stats.setdefault(handler.name,[0,0.0,0.0])
+			times[0] += 1
+			times[1] += elapsed
+			times[2]  = max(times[2],elapsed)
+			return result
+		return maybeDeferred(LabradServer._dispatch,self,func,*args,**kw).addBoth(record)
+
 	#######################
 	## Registry handling ##
 	#######################
 	
 	@inlineCallbacks
 	def registry_setup(self):
+		"""Creates the channel folder in the registry if it doesn't exist yet"""
+		ctx = yield self.reg_pool.lease()
+		try:
+			yield self.reg.cd(self.channel_location,True,context=ctx)
+		finally:
+			self.reg_pool.release(ctx)
 
-		yield self.reg.cd(self.channel_location,True,context=self.reg_context)
+	@inlineCallbacks
+	def reg_dir(self,folder_loc=None):
+		"""Returns (folders,files) of a registry folder. folder_loc is relative to channel_location"""
+		folder_loc = folder_loc or []
+		ctx = yield self.reg_pool.lease()
+		try:
+			yield self.reg.cd(self.channel_location+folder_loc,context=ctx)
+			ret = yield self.reg.dir(context=ctx)
+		finally:
+			self.reg_pool.release(ctx)
+		returnValue(ret)
+
+	@inlineCallbacks
+	def reg_get(self,folder_loc,keys,defaults=None):
+		"""Returns the values of a list of keys in a registry folder. folder_loc is relative to channel_location.\nKeys in defaults that are missing from the folder take their default value instead."""
+		defaults = defaults or {}
+		values   = []
+		ctx      = yield self.reg_pool.lease()
+		try:
+			yield self.reg.cd(self.channel_location+folder_loc,context=ctx)
+			if defaults:
+				folders,files = yield self.reg.dir(context=ctx)
+			for key in keys:
+				if (key in defaults) and not (key in files):
+					values.append(defaults[key])
+					continue
+				value = yield self.reg.get(key,context=ctx)
+				values.append(value)
+		finally:
+			self.reg_pool.release(ctx)
+		returnValue(values)
+
+	@inlineCallbacks
+	def reg_set(self,folder_loc,items,create=False):
+		"""Sets a list of [key,value] pairs in a registry folder. folder_loc is relative to channel_location.\nIf create is True the folder is created if it doesn't exist."""
+		ctx = yield self.reg_pool.lease()
+		try:
+			yield self.reg.cd(self.channel_location+folder_loc,create,context=ctx)
+			for key,value in items:
+				yield self.reg.set(key,value,context=ctx)
+		finally:
+			self.reg_pool.release(ctx)
 
 	@inlineCallbacks
 	def get_attributes(self,attribute):
 		"""Gets a list of all channels' values for a specified attribute"""
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		attrs	= []
-		yield self.reg.cd(self.channel_location,context=self.reg_context)
-		folders,files = yield self.reg.dir(context=self.reg_context)
-		for folder in folders:
-			yield self.reg.cd(self.channel_location+[folder],context=self.reg_context)
-			attr = yield self.reg.get(attribute,context=self.reg_context)
-			attrs.append(attr)
-		yield self.reg.cd(prev_dir,context=self.reg_context)
-		returnValue(attrs)
+		folders,files = yield self.reg_dir()
+		attrs = yield gather([self.reg_get([folder],[attribute]) for folder in folders])
+		returnValue([attr[0] for attr in attrs])
 
 	@inlineCallbacks
 	def get_folders_by_attribute(self,attribute,value):
 		"""Find a channel by its value for a particular attribute"""
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		attr_folders = []
-		yield self.reg.cd(self.channel_location,context=self.reg_context)
-		folders,files=yield self.reg.dir(context=self.reg_context)
-		for folder in folders:
-			yield self.reg.cd(self.channel_location+[folder],context=self.reg_context)
-			fval = yield self.reg.get(attribute,context=self.reg_context)
-			if fval == value:attr_folders.append(folder)
-		yield self.reg.cd(prev_dir,context=self.reg_context)
-		returnValue( attr_folders )
+		folders,files = yield self.reg_dir()
+		fvals = yield gather([self.reg_get([folder],[attribute]) for folder in folders])
+		returnValue([folder for folder,fval in zip(folders,fvals) if fval[0] == value])
 
 	@inlineCallbacks
 	def del_folder(self,folder_loc,recur=False):
 		"""Removes a folder & its keys. If recur is set to True, recursively removes subfolders & subfolder keys."""
 		if type(folder_loc) != type([]):folder_loc=[folder_loc]
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		yield self.reg.cd(self.channel_location+folder_loc,context=self.reg_context)
-		folders,files = yield self.reg.dir(context=self.reg_context)
-		for folder in folders:
-			if recur:
+		folders,files = yield self.reg_dir(folder_loc)
+		if recur:
+			for folder in folders:
 				yield self.del_folder(folder_loc+[folder],True)
-			else:
-				pass
-		for file in files:
-			yield self.reg.del_(file,context=self.reg_context)
-		yield self.reg.cd(self.channel_location+folder_loc[:-1],context=self.reg_context)
-		yield self.reg.rmdir(folder_loc[-1],context=self.reg_context)
+		ctx = yield self.reg_pool.lease() # not held across the recursion above, so deep trees can't exhaust the pool
 		try:
-			yield self.reg.cd(prev_dir,context=self.reg_context)
-		except:
-			yield self.reg.cd(self.channel_location,context=self.reg_context)
+			yield self.reg.cd(self.channel_location+folder_loc,context=ctx)
+			for file in files:
+				yield self.reg.del_(file,context=ctx)
+			yield self.reg.cd(self.channel_location+folder_loc[:-1],context=ctx)
+			yield self.reg.rmdir(folder_loc[-1],context=ctx)
+		finally:
+			self.reg_pool.release(ctx)
 
 	@inlineCallbacks
 	def get_folder_by_id_name(self,ID=None,name=None):
@@ -257,45 +401,45 @@ class VirtualDeviceServer(LabradServer):
 		set_max,
 		set_offset,
 		set_scale,
+		set_group_setting,
+		set_group_slot,
 
 		):
 
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		yield self.reg.cd(self.channel_location,True,context=self.reg_context)
-
-		# create and go to folder for new channel
 		entryName = "%s (%s)"%(ID,name)
-		yield self.reg.cd(self.channel_location+[entryName],True,context=self.reg_context)
 
 		# informational attributes
-		yield self.reg.set("name",        name,        context=self.reg_context) # Write the name
-		yield self.reg.set("ID",          ID,          context=self.reg_context) # Write the ID
-		yield self.reg.set("label",       label,       context=self.reg_context) # Write the label
-		yield self.reg.set("description", description, context=self.reg_context) # Write the description
-		yield self.reg.set("tags",        tags,        context=self.reg_context) # write the tags
-
-		yield self.reg.set("has_get",     has_get,     context=self.reg_context)
-		yield self.reg.set("has_set",     has_set,     context=self.reg_context)
+		yield self.reg_set([entryName],[
+			["name",        name       ], # Write the name
+			["ID",          ID         ], # Write the ID
+			["label",       label      ], # Write the label
+			["description", description], # Write the description
+			["tags",        tags       ], # write the tags
+			["has_get",     has_get    ],
+			["has_set",     has_set    ],
+			],create=True)
 
 		# <get> folder
-		yield self.reg.cd(self.channel_location+[entryName,"get"],True,context=self.reg_context)
-		yield self.reg.set("setting",      get_setting,      context=self.reg_context)
-		yield self.reg.set("inputs",       get_inputs,       context=self.reg_context)
-		yield self.reg.set("inputs_units", get_inputs_units, context=self.reg_context)
+		yield self.reg_set([entryName,"get"],[
+			["setting",      get_setting     ],
+			["inputs",       get_inputs      ],
+			["inputs_units", get_inputs_units],
+			],create=True)
 
 		# <set> folder
-		yield self.reg.cd(self.channel_location+[entryName,"set"],True,context=self.reg_context)
-		yield self.reg.set("setting",       set_setting,       context=self.reg_context)
-		yield self.reg.set("var_slot",      set_var_slot,      context=self.reg_context)
-		yield self.reg.set("var_units",     set_var_units,     context=self.reg_context)
-		yield self.reg.set("statics",       set_statics,       context=self.reg_context)
-		yield self.reg.set("statics_units", set_statics_units, context=self.reg_context)
-		yield self.reg.set("min",           set_min,           context=self.reg_context)
-		yield self.reg.set("max",           set_max,           context=self.reg_context)
-		yield self.reg.set("offset",        set_offset,        context=self.reg_context)
-		yield self.reg.set("scale",         set_scale,         context=self.reg_context)
-
-		yield self.reg.cd(prev_dir,context=self.reg_context)
+		yield self.reg_set([entryName,"set"],[
+			["setting",       set_setting      ],
+			["var_slot",      set_var_slot     ],
+			["var_units",     set_var_units    ],
+			["statics",       set_statics      ],
+			["statics_units", set_statics_units],
+			["min",           set_min          ],
+			["max",           set_max          ],
+			["offset",        set_offset       ],
+			["scale",         set_scale        ],
+			["group_setting", set_group_setting],
+			["group_slot",    set_group_slot   ],
+			],create=True)
 
 	@inlineCallbacks
 	def del_channel_from_registry(self,ID=None,name=None):
@@ -314,37 +458,24 @@ class VirtualDeviceServer(LabradServer):
 	def load_channel(self,channel_folder):
 		"""Loads a channel from the registry to a ChannelInstance object"""
 
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		yield self.reg.cd(self.channel_location+[channel_folder],context=self.reg_context)
+		# the three folders are independent, so they're read concurrently (each in its own registry context)
+		info,get_info,set_info = yield gather([
+			self.reg_get([channel_folder],      self.info_keys),
+			self.reg_get([channel_folder,"get"],self.get_keys),
+			self.reg_get([channel_folder,"set"],self.set_keys+["group_setting","group_slot"],
+				defaults={"group_setting":[],"group_slot":0}), # channels written before group settings existed don't have these
+
+			])
 
 		# informational stuff
-		ID          = yield self.reg.get("ID",          context=self.reg_context)
-		name        = yield self.reg.get("name",        context=self.reg_context)
-		label       = yield self.reg.get("label",       context=self.reg_context)
-		description = yield self.reg.get("description", context=self.reg_context)
-		tags        = yield self.reg.get("tags",        context=self.reg_context)
-		has_get     = yield self.reg.get("has_get",     context=self.reg_context)
-		has_set     = yield self.reg.get("has_set",     context=self.reg_context)
+		ID, name, label, description, tags, has_get, has_set = info
 
 		# <get> folder
-		yield self.reg.cd(self.channel_location+[channel_folder,"get"],context=self.reg_context)
-		get_setting      = yield self.reg.get("setting",      context=self.reg_context)
-		get_inputs       = yield self.reg.get("inputs",       context=self.reg_context)
-		get_inputs_units = yield self.reg.get("inputs_units", context=self.reg_context)
+		get_setting, get_inputs, get_inputs_units = get_info
 		get_inputs = [to_type(get_inputs[n],get_inputs_units[n]) for n in range(len(get_inputs))] # convert get_inputs to specified types
 
-
 		# <set> folder
-		yield self.reg.cd(self.channel_location+[channel_folder,"set"],context=self.reg_context)
-		set_setting       = yield self.reg.get("setting",       context=self.reg_context)
-		set_var_slot      = yield self.reg.get("var_slot",      context=self.reg_context)
-		set_var_units     = yield self.reg.get("var_units",     context=self.reg_context)
-		set_statics       = yield self.reg.get("statics",       context=self.reg_context)
-		set_statics_units = yield self.reg.get("statics_units", context=self.reg_context)
-		set_min	          = yield self.reg.get("min",           context=self.reg_context)
-		set_max           = yield self.reg.get("max",           context=self.reg_context)
-		set_offset        = yield self.reg.get("offset",        context=self.reg_context)
-		set_scale         = yield self.reg.get("scale",         context=self.reg_context)
+		set_setting, set_var_slot, set_var_units, set_statics, set_statics_units, set_min, set_max, set_offset, set_scale, set_group_setting, set_group_slot = set_info
 		set_statics = [to_type(set_statics[n],set_statics_units[n]) for n in range(len(set_statics))] # convert statics to specified types
 
 		set_min    = yield self.bound_interp(set_min   ) # These are stored as strings in the regsitry
@@ -352,8 +483,6 @@ class VirtualDeviceServer(LabradServer):
 		set_offset = yield self.bound_interp(set_offset) # or floats. bound_interp converts "none" or empty
 		set_scale  = yield self.bound_interp(set_scale ) # strings to <None>, and otherwise to floats.
 
-		yield self.reg.cd(prev_dir,context=self.reg_context)
-
 		channel = ChannelInstance(
 			self.client.context(),              # a unique context for this channel
 			ID, name, label, description, tags, # informational attributes
@@ -362,6 +491,7 @@ class VirtualDeviceServer(LabradServer):
 			set_setting, set_var_slot, set_var_units,  # <SET> info
 			set_statics, set_statics_units,            # <SET> info
 			set_min, set_max, set_offset, set_scale,   # <SET> info
+			set_group_setting, set_group_slot,         # <SET> info
 			)
 
 		returnValue(channel)
@@ -369,29 +499,46 @@ class VirtualDeviceServer(LabradServer):
 	@inlineCallbacks
 	def load_all_channels(self):
 		"""Loads all channels from registry & returns dicts by ID & by name"""
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		yield self.reg.cd(self.channel_location,context=self.reg_context)
-		folders,files = yield self.reg.dir(context=self.reg_context)
+		folders,files = yield self.reg_dir()
 		channels = []
 		for channel_folder in folders:
 
 			try:
 				channel = yield self.load_channel(channel_folder)
 				channels.append(channel)
-			except:
-				print("Found invalid folder: {channel_folder}; deleting it".format(channel_folder=channel_folder))
-				yield self.del_folder(channel_folder,True)
+			except Exception as e:
+				# Only folders that are actually missing required keys get deleted; any other error
+				# (e.g. a transient registry failure) just skips the channel, leaving its data intact.
+				try:
+					missing = yield self.missing_channel_keys(channel_folder)
+				except Exception:
+					missing = []
+				if missing:
+					print("Found invalid folder: {channel_folder} (missing {missing}); deleting it".format(channel_folder=channel_folder,missing=missing))
+					yield self.del_folder(channel_folder,True)
+				else:
+					print("Failed to load channel from folder: {channel_folder} ({e}); skipping it".format(channel_folder=channel_folder,e=e))
 
-		yield self.reg.cd(prev_dir,context=self.reg_context)
 		returnValue([{channel.ID:channel for channel in channels},{channel.name:channel for channel in channels}])
 
+	@inlineCallbacks
+	def missing_channel_keys(self,channel_folder):
+		"""Returns the required keys (as "subfolder/key") missing from a channel's registry folder"""
+		missing = []
+		folders,files = yield self.reg_dir([channel_folder])
+		missing += [key for key in self.info_keys if not (key in files)]
+		for subfolder,keys in [["get",self.get_keys],["set",self.set_keys]]:
+			if not (subfolder in folders):
+				missing.append(subfolder+"/")
+				continue
+			sub_folders,sub_files = yield self.reg_dir([channel_folder,subfolder])
+			missing += [subfolder+"/"+key for key in keys if not (key in sub_files)]
+		returnValue(missing)
+
 	@inlineCallbacks
 	def reg_modify(self,channel_folder,attribute,new_value,subfolder=None):
-		prev_dir = yield self.reg.cd(context=self.reg_context)
-		yield self.reg.cd(self.channel_location+[channel_folder],context=self.reg_context)
-		if subfolder:yield self.reg.cd(subfolder,context=self.reg_context)
-		yield self.reg.set(attribute,new_value,context=self.reg_context)
-		yield self.reg.cd(prev_dir,context=self.reg_context)
+		folder_loc = [channel_folder,subfolder] if subfolder else [channel_folder]
+		yield self.reg_set(folder_loc,[[attribute,new_value]])
 
 	@inlineCallbacks
 	def bound_interp(self,bound):
@@ -436,6 +583,35 @@ class VirtualDeviceServer(LabradServer):
 
 		returnValue(channel)
 
+	def adjusted_set_value(self,channel,value):
+		"""Applies a channel's scale & offset to a value, checks the result against the channel's bounds, and converts it to the channel's units"""
+		set_var_value = (value * channel.set_scale) + channel.set_offset
+		if set_var_value > channel.set_max:raise ValueError("value set (raw:{value}, adjusted:{set_var_value}) exceeds max value:{max}".format(value=value,set_var_value=set_var_value,max=channel.set_max))
+		if set_var_value < channel.set_min:raise ValueError("value set (raw:{value}, adjusted:{set_var_value}) deceeds min value:{min}".format(value=value,set_var_value=set_var_value,min=channel.set_min))
+		return to_type(set_var_value,channel.set_var_units)
+
+	@inlineCallbacks
+	def call_device_setting(self,device_setting,inputs,context):
+		"""Calls device_setting ([server, device, setting]) with inputs in the given context, selecting the device if needed"""
+		try: # first we try to send the setting in the given context.
+			ret = yield self.client[device_setting[0]][device_setting[2]](inputs,context=context)
+		except: # if it fails we try selecting the device & sending the request again
+			yield self.client[device_setting[0]].select_device(device_setting[1],context=context)
+			ret = yield self.client[device_setting[0]][device_setting[2]](inputs,context=context)
+			# if it fails here we don't catch it, as it failed for a reason other than
+			# not being selected, and we want the user to see the error message.
+		returnValue(ret)
+
+	@inlineCallbacks
+	def set_channel_output(self,channel,set_var_value):
+		"""Sends an (already adjusted) value to a channel's set setting, along with the channel's statics"""
+		if len(channel.set_statics) == 0:
+			inputs = set_var_value
+		else:
+			inputs = assemble_set_list(channel.set_var_slot,set_var_value,channel.set_statics)
+		ret = yield self.call_device_setting(channel.set_setting,inputs,channel.context)
+		returnValue(ret)
+
 	##############
 	## Settings ##
 	##############
@@ -460,10 +636,15 @@ class VirtualDeviceServer(LabradServer):
 		set_max           = 's',  # But to allow for either they are strings
 		set_offset        = 's',  # The strings must be interpretable as either
 		set_scale         = 's',  # floats or None types.
+		set_group_setting = '*s', # Optional; [server, device, setting] of a setting that sets several outputs at once
+		set_group_slot    = 'i',  # Optional; which output of the group setting this channel is
 
 		returns = 'b{success}')
-	def reg_add_channel(self, c, ID, name, label, description, tags, has_get, has_set, get_setting, get_inputs, get_inputs_units, set_setting, set_var_slot, set_var_units, set_statics, set_statics_units, set_min, set_max, set_offset, set_scale):
-		"""Adds a new channel to the regsitry.\nDoes not override; to overwrite, first delete the old channel."""
+	def reg_add_channel(self, c, ID, name, label, description, tags, has_get, has_set, get_setting, get_inputs, get_inputs_units, set_setting, set_var_slot, set_var_units, set_statics, set_statics_units, set_min, set_max, set_offset, set_scale, set_group_setting=None, set_group_slot=0):
+		"""Adds a new channel to the regsitry.\nDoes not override; to overwrite, first delete the old channel.\nset_group_setting and set_group_slot are optional, and are used by set_channels_synchronized."""
+
+		if set_group_setting is None:set_group_setting = []
+		check_group_setting(set_group_setting,set_group_slot)
 
 		# make sure ID is valid
 		try:
@@ -487,7 +668,7 @@ class VirtualDeviceServer(LabradServer):
 				raise ValueError("Value ({isnt}) for minValue,maxValue,scale,offset not interpetable as either float or NoneType".format(inst=inst))
 
 		# write the channel entry
-		yield self.write_channel_to_registry(ID,name,label,description,tags,has_get,has_set,get_setting,get_inputs,get_inputs_units,set_setting,set_var_slot,set_var_units,set_statics,set_statics_units,set_min,set_max,set_offset,set_scale)
+		yield self.write_channel_to_registry(ID,name,label,description,tags,has_get,has_set,get_setting,get_inputs,get_inputs_units,set_setting,set_var_slot,set_var_units,set_statics,set_statics_units,set_min,set_max,set_offset,set_scale,set_group_setting,set_group_slot)
 
 		# Now load & add the new channel
 		channel = yield self.load_channel_by_id_name(ID = ID)
@@ -527,9 +708,9 @@ class VirtualDeviceServer(LabradServer):
 	#def list_active_channel(self,c):
 	#	yield
 
-	@setting(102,"list channel details",ID='s',name='s',returns='(ssss*sbb*s*?*s*sis*?*svvvv)')
+	@setting(102,"list channel details",ID='s',name='s',returns='(ssss*sbb*s*?*s*sis*?*svvvv*si)')
 	def list_channel_details(self,c,ID,name=""):
-		"""Returns the details of a given channel in the form of a list (ID,name,label,description,tags,has_get,has_set,get_setting,get_inputs,get_inputs_units,set_setting,set_var_slot,set_var_units,set_statics,set_statics_units,set_min,set_max,set_offset,set_scale)"""
+		"""Returns the details of a given channel in the form of a list (ID,name,label,description,tags,has_get,has_set,get_setting,get_inputs,get_inputs_units,set_setting,set_var_slot,set_var_units,set_statics,set_statics_units,set_min,set_max,set_offset,set_scale,set_group_setting,set_group_slot)"""
 		channel = yield self.get_channel_by_id_name(ID,name)
 		returnValue([
 			channel.ID,
@@ -551,6 +732,8 @@ class VirtualDeviceServer(LabradServer):
 			channel.set_max,
 			channel.set_offset,
 			channel.set_scale,
+			channel.set_group_setting,
+			channel.set_group_slot,
 			])
 
 	@setting(103,"modify channel details",modifications='*(s?)',ID='s',name='s',returns='b{success}')
@@ -595,7 +778,9 @@ class VirtualDeviceServer(LabradServer):
 				if new_val in existing_values:
 					raise ValueError("Tried to change <{attr}> to value <{new_val}>, which is already taken. ({attr} must be unique. Taken values: {existing_values})".format(attr=attr,new_val=new_val,existing_values=existing_values))
 
-
+		# group setting & slot get the same checks as in reg_add_channel
+		new_values = dict(typed_modifications)
+		check_group_setting(new_values.get('set_group_setting',channel.set_group_setting),new_values.get('set_group_slot',channel.set_group_slot))
 
 		# all the modifications in typed_modifications must be valid, so we may continue
 		for mod in typed_modifications:
@@ -658,32 +843,64 @@ class VirtualDeviceServer(LabradServer):
 		if not channel.has_set:
 			raise ValueError("Tried to set_channel on a channel that does not support set commands")
 
-		set_var_value = (value * channel.set_scale) + channel.set_offset
-		if set_var_value > channel.set_max:raise ValueError("value set (raw:{value}, adjusted:{set_var_value}) exceeds max value:{max}".format(value=value,set_var_value=set_var_value,max=channel.set_max))
-		if set_var_value < channel.set_min:raise ValueError("value set (raw:{value}, adjusted:{set_var_value}) deceeds min value:{min}".format(value=value,set_var_value=set_var_value,min=channel.set_min))
-		
-		units = channel.set_var_units
-		set_var_value = to_type(set_var_value,units)
-		
-		if len(channel.set_statics) == 0:
-			try: # first we try to send the setting in the channel's context.
-				ret = yield self.client[channel.set_setting[0]][channel.set_setting[2]](set_var_value,context=channel.context)
-			except: # if it fails we try selecting the device & sending the request again
-				yield self.client[channel.set_setting[0]].select_device(channel.set_setting[1],context=channel.context)
-				ret = yield self.client[channel.set_setting[0]][channel.set_setting[2]](set_var_value,context=channel.context)
-				# if it fails here we don't catch it, as it failed for a reason other than
-				# not being selected, and we want the user to see the error message.
-		else:
-			inputs = assemble_set_list(channel.set_var_slot,set_var_value,channel.set_statics)
-			try:
-				ret = yield self.client[channel.set_setting[0]][channel.set_setting[2]](inputs,context=channel.context)
-			except:
-				yield self.client[channel.set_setting[0]].select_device(channel.set_setting[1],context=channel.context)
-				ret = yield self.client[channel.set_setting[0]][channel.set_setting[2]](inputs,context=channel.context)
+		set_var_value = self.adjusted_set_value(channel,value)
+		ret           = yield self.set_channel_output(channel,set_var_value)
 
 		self.signal__channel_set([channel.ID,channel.name,str(ret)])
 		returnValue(str(ret))
 
+	@setting(1002,"set channels synchronized",IDs='*s',names='*s',values='*v',returns='*s{responses}')
+	def set_channels_synchronized(self,c,values,IDs,names=None):
+		"""Set the outputs of several channels at once. \nChannels specified by lists of IDs and/or names (use "" for unspecified entries). \nOutputs specified by values, in the same order. \nChannels that share a group setting (set_group_setting) are set with a single call to it, with inputs [(set_group_slot, value), ...] sorted by slot. Channels without one are set concurrently with their own set setting. \nReturns the response for each channel."""
+		if names is None:names = [""]*len(IDs)
+		if not (len(values) == len(IDs) == len(names)):
+			raise ValueError("values ({n_values}), IDs ({n_IDs}) and names ({n_names}) must have the same length".format(n_values=len(values),n_IDs=len(IDs),n_names=len(names)))
+
+		channels = []
+		for ID,name in zip(IDs,names):
+			channel = yield self.get_channel_by_id_name(ID,name)
+			if not channel.has_set:
+				raise ValueError("Tried to set_channels_synchronized on a channel ({ID}, {name}) that does not support set commands".format(ID=channel.ID,name=channel.name))
+			if channel in channels:
+				raise ValueError("Channel ({ID}, {name}) was specified more than once".format(ID=channel.ID,name=channel.name))
+			channels.append(channel)
+
+		# Every value is checked before anything is sent, so that one bad value can't leave the outputs partially set
+		set_var_values = [self.adjusted_set_value(channel,value) for channel,value in zip(channels,values)]
+
+		# Sort channels into groups by group setting; each group becomes one call
+		groups  = {}
+		singles = []
+		for n,channel in enumerate(channels):
+			if channel.set_group_setting:
+				groups.setdefault(tuple(channel.set_group_setting),[]).append(n)
+			else:
+				singles.append(n)
+
+		calls = [] # [ [indices of channels covered by the call, [server, device, setting], inputs, context], ... ]
+		for group_setting,indices in groups.items():
+			indices = sorted(indices,key=lambda n:channels[n].set_group_slot)
+			slots   = [channels[n].set_group_slot for n in indices]
+			if len(set(slots)) != len(slots):
+				raise ValueError("Multiple channels have the same slot for group setting {group_setting}; slots were {slots}".format(group_setting=list(group_setting),slots=slots))
+			inputs = [(channels[n].set_group_slot,set_var_values[n]) for n in indices] # tuples, so each is sent as an (iv) cluster rather than a list
+			if not (group_setting in self.group_contexts):self.group_contexts[group_setting] = self.client.context()
+			calls.append([indices,list(group_setting),inputs,self.group_contexts[group_setting]])
+
+		# Each call is made in a different context (its group setting's or its channel's), so they all go out at once
+		deferreds  = [self.call_device_setting(group_setting,inputs,context) for indices,group_setting,inputs,context in calls]
+		deferreds += [self.set_channel_output(channels[n],set_var_values[n]) for n in singles]
+		rets = yield gather(deferreds)
+
+		responses = [None]*len(channels)
+		for indices,ret in zip([call[0] for call in calls]+[[n] for n in singles],rets):
+			for n in indices:
+				responses[n] = str(ret)
+
+		for channel,response in zip(channels,responses):
+			self.signal__channel_set([channel.ID,channel.name,response])
+		returnValue(responses)
+
 	@setting(1001,"get channel",ID='s',name='s',returns='v{value}')
 	def get_channel(self,c,ID,name=""):
 		"""Gets the value (input or set output) of a channel. \nChannel specified by name and/or ID"""
@@ -716,6 +933,55 @@ class VirtualDeviceServer(LabradServer):
 		self.signal__channel_get([channel.ID,channel.name,ret])
 		returnValue(ret)
 
+	###############
+	## Profiling ##
+	###############
+
+	@setting(2000,"profiling mode",enable='b',returns='b{enabled}')
+	def profiling_mode(self,c,enable=None):
+		"""Turns profiling mode (reactor lag monitor & setting wall-time tracing) on or off. \nTurning it on clears previously collected data. \nReturns whether profiling mode is on; call with no arguments to just check."""
+		if enable is None:return self.profiling
+		if enable and not self.profiling:
+			self.lag_monitor.samples.clear()
+			self.setting_stats = {}
+			self.lag_monitor.start()
+		if not enable:
+			self.lag_monitor.stop()
+		self.profiling = enable
+		return self.profiling
+
+	@setting(2001,"reactor lag",returns='(ivvvv){n_samples,p50,p90,p99,max}')
+	def reactor_lag(self,c):
+		"""Returns the number of reactor lag samples, and the 50th, 90th & 99th percentile and maximum lag in milliseconds. \nOnly collected while profiling mode is on."""
+		p50,p90,p99,p100 = self.lag_monitor.percentiles([50,90,99,100])
+		return (len(self.lag_monitor.samples),p50*1e3,p90*1e3,p99*1e3,p100*1e3)
+
+	@setting(2002,"setting times",returns='*(sivv){name,calls,mean,max}')
+	def setting_times(self,c):
+		"""Returns [name, number of calls, mean wall time, max wall time] for every setting called while profiling mode was on, slowest total first. Times are in milliseconds."""
+		times = sorted(self.setting_stats.items(),key=lambda item:-item[1][1])
+		return [(name,calls,total/calls*1e3,longest*1e3) for name,(calls,total,longest) in times]
+
+	@setting(2003,"profile",seconds='v',filename='s',returns='s{path}')
+	def profile(self,c,seconds,filename=""):
+		"""Runs cProfile on the server for the given number of seconds and writes the stats (pstats format) to filename in profile_location. \nfilename defaults to a timestamped name. Returns the path of the file written. \nDoes not require profiling mode."""
+		if self.profiler is not None:raise ValueError("A profile is already being captured")
+		if seconds <= 0:raise ValueError("seconds must be positive; was {seconds}".format(seconds=seconds))
+		if not filename:filename = time.strftime("vds_profile_%Y%m%d_%H%M%S.prof")
+		filename = os.path.basename(filename) # filename comes from the client; keep captures inside profile_location
+		if (not filename) or filename.startswith('.'):raise ValueError("Invalid filename for profile: must be a plain file name not starting with '.'")
+		path = os.path.abspath(os.path.join(self.profile_location,filename))
+
+		self.profiler = cProfile.Profile()
+		self.profiler.enable()
+		try:
+			yield deferLater(reactor,seconds,lambda:None)
+		finally:
+			self.profiler.disable()
+			profiler,self.profiler = self.profiler,None
+		profiler.dump_stats(path)
+		returnValue(path)
+
 
 
 __server__ = VirtualDeviceServer()